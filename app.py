@@ -1,60 +1,115 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import contextlib
+import hashlib
+import os
+import tempfile
 from io import BytesIO
 
+# Copy-on-Write is always enabled from pandas 3.0; opt in explicitly on 2.x
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def normalize_outcome(outcome):
+    # Strip/lowercase the category labels instead of every value, merging labels that collapse together
+    outcome = outcome.astype('category')
+    labels = outcome.cat.categories.str.strip().str.lower()
+    categories = pd.Index(labels.dropna().unique())
+    label_codes = categories.get_indexer(labels)
+    old_codes = outcome.cat.codes.to_numpy()
+    codes = np.full(len(old_codes), -1, dtype=label_codes.dtype)
+    present = old_codes >= 0
+    codes[present] = label_codes[old_codes[present]]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=outcome.index, name=outcome.name)
+
+
+def outcome_mask(outcome, labels):
+    categories = outcome.cat.categories
+    label_codes = [categories.get_loc(label) for label in labels if label in categories]
+    return np.isin(outcome.cat.codes.to_numpy(), label_codes)
+
+
+def parse_call_dates(dates):
+    # Arrow CSV ingest and read_excel usually hand over real timestamps already
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return pd.to_datetime(dates)
+    # Fast ISO8601 path first; only values it can't parse go through format inference
+    parsed = pd.to_datetime(dates, format='ISO8601', errors='coerce')
+    unparsed = parsed.isna() & dates.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(dates[unparsed], errors='coerce')
+    return parsed
+
+
 def calculate_report(df, avg_col=None):
-    df['outcome'] = df['outcome'].str.strip().str.lower()
     required_cols = ['bot', 'mobile_number', 'outcome', 'contacted', 'date', 'recording_url']
-    if not all(col in df.columns for col in required_cols):
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        st.error(f"Missing columns: {', '.join(missing_cols)}")
+    missing_cols = set(required_cols) - set(df.columns)
+    if missing_cols:
+        st.error(f"Missing columns: {', '.join(sorted(missing_cols))}")
         return None, None
 
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['outcome'] = normalize_outcome(df['outcome'])
+    df['date'] = parse_call_dates(df['date'])
     df = df.dropna(subset=['date'])
 
-    df['contacted'] = pd.to_numeric(df['contacted'], errors='coerce').fillna(0).astype(int)
-    df['bot'] = df['bot'].fillna('Blank_Bot_Name')
+    # Cast through float64 so coerced values from Arrow-backed columns become NaN that fillna catches
+    df['contacted'] = pd.to_numeric(df['contacted'], errors='coerce').astype('float64').fillna(0).astype(int)
+    df['bot'] = df['bot'].fillna('Blank_Bot_Name').astype('category')
 
     df['recording_url'] = df['recording_url'].fillna('').astype(str).str.strip()
 
-    all_bots = sorted(df['bot'].unique())
+    # Categories are the sorted bot names; groupbys below use the integer codes with observed=True
+    all_bots = list(df['bot'].cat.categories)
 
-    latest_per_lead = df.sort_values('date').groupby(['bot', 'mobile_number'], as_index=False).last()
+    # One grouper over (bot, mobile_number) yields both the latest call and the connection status per lead
+    lead_keys = ['bot', 'mobile_number']
+    df['has_recording'] = df['recording_url'].ne('').to_numpy()
+    # idxmax keeps the first of equal dates, so group the log in reverse to break ties toward the last row in the file
+    lead_calls = df.iloc[::-1].groupby(lead_keys, observed=True).agg(
+        latest_idx=('date', 'idxmax'),
+        is_connected=('has_recording', 'any'),
+    )
+    latest_per_lead = df.loc[lead_calls['latest_idx']].drop(columns='has_recording').reset_index(drop=True)
 
-    # Determine if any call for bot/mobile_number has non-empty recording_url
-    lead_connection_status = df.groupby(['bot', 'mobile_number'])['recording_url'].apply(lambda urls: (urls != '').any()).reset_index().rename(columns={'recording_url': 'is_connected'})
+    # Keep the latest non-blank outcome per lead, as groupby().last() did
+    outcome_calls = df[lead_keys + ['date', 'outcome']].dropna(subset=['outcome'])
+    outcome_idx = outcome_calls.iloc[::-1].groupby(lead_keys, observed=True)['date'].idxmax()
+    latest_outcome = outcome_calls.loc[outcome_idx].set_index(lead_keys)['outcome']
+    latest_per_lead['outcome'] = latest_outcome.reindex(
+        pd.MultiIndex.from_frame(latest_per_lead[lead_keys])
+    ).array
 
-    latest_per_lead = latest_per_lead.merge(lead_connection_status, on=['bot', 'mobile_number'], how='left')
+    # A lead is connected if any of its calls has a recording
+    latest_per_lead['is_connected'] = lead_calls['is_connected'].to_numpy()
 
     follow_up_exclude = {"assign to live agent", "converted", "lost"}
 
-    unique_leads_row = {'Metric': 'Unique leads'}
-    total_attempts_row = {'Metric': 'Total Attempts'}
-    avg_attempts_row = {'Metric': 'Avg Attempts'}
-    connected_row = {'Metric': 'Connected'}
-    connectivity_perc_row = {'Metric': 'Connectivity % :'}
-    not_connected_row = {'Metric': 'Not Connected'}
-    follow_up_row = {'Metric': 'Follow Up'}
-    assigned_agent_row = {'Metric': 'Assigned to human agent'}
-    lost_row = {'Metric': 'Lost'}
-    converted_row = {'Metric': 'Converted'}
-
     # Flags based on new logic
-    latest_per_lead['connected_flag'] = latest_per_lead['is_connected'] == True
-    latest_per_lead['not_connected_flag'] = latest_per_lead['is_connected'] == False
-    latest_per_lead['converted_flag'] = latest_per_lead['outcome'] == 'converted'
-    latest_per_lead['lost_flag'] = latest_per_lead['outcome'] == 'lost'
-    latest_per_lead['assigned_to_agent_flag'] = latest_per_lead['outcome'] == 'assign to live agent'
-    latest_per_lead['follow_up_flag'] = ~latest_per_lead['outcome'].isin(follow_up_exclude)
-
-    sheets_by_category = {}
-    sheets_by_category["connected"] = latest_per_lead[latest_per_lead['connected_flag']]
-    sheets_by_category["not_connected"] = latest_per_lead[latest_per_lead['not_connected_flag']]
-    sheets_by_category["converted"] = latest_per_lead[latest_per_lead['converted_flag']]
-    sheets_by_category["lost"] = latest_per_lead[latest_per_lead['lost_flag']]
-    sheets_by_category["assigned_to_human_agent"] = latest_per_lead[latest_per_lead['assigned_to_agent_flag']]
-    sheets_by_category["follow_up"] = latest_per_lead[latest_per_lead['follow_up_flag']]
+    connected = latest_per_lead['is_connected'].to_numpy()
+    latest_per_lead['connected_flag'] = connected
+    latest_per_lead['not_connected_flag'] = ~connected
+    outcome = latest_per_lead['outcome']
+    latest_per_lead['converted_flag'] = outcome_mask(outcome, ['converted'])
+    latest_per_lead['lost_flag'] = outcome_mask(outcome, ['lost'])
+    latest_per_lead['assigned_to_agent_flag'] = outcome_mask(outcome, ['assign to live agent'])
+    latest_per_lead['follow_up_flag'] = ~outcome_mask(outcome, follow_up_exclude)
+
+    # Category sheets share latest_per_lead and are only filtered when written to Excel
+    sheets_by_category = {
+        name: (latest_per_lead, latest_per_lead[flag].to_numpy())
+        for name, flag in [
+            ("connected", 'connected_flag'),
+            ("not_connected", 'not_connected_flag'),
+            ("converted", 'converted_flag'),
+            ("lost", 'lost_flag'),
+            ("assigned_to_human_agent", 'assigned_to_agent_flag'),
+            ("follow_up", 'follow_up_flag'),
+        ]
+    }
 
     lead_summary_cols = [
         'bot', 'mobile_number', 'date', 'outcome',
@@ -65,79 +120,78 @@ def calculate_report(df, avg_col=None):
         ['bot', 'date'], ascending=[True, False]
     )
 
-    for bot_name in all_bots:
-        bot_df_all = df[df['bot'] == bot_name]
-        total_attempts = len(bot_df_all)
-        unique_leads = bot_df_all['mobile_number'].nunique()
-        avg_attempts = round(total_attempts / unique_leads, 2) if unique_leads > 0 else 0.0
-
-        bot_latest = latest_per_lead[latest_per_lead['bot'] == bot_name]
-
-        connected_count = bot_latest[bot_latest['connected_flag']]['mobile_number'].nunique()
-        not_connected_count = bot_latest[bot_latest['not_connected_flag']]['mobile_number'].nunique()
-        connectivity_perc = round((connected_count / unique_leads), 2) if unique_leads > 0 else 0.0
-        follow_up_count = bot_latest[bot_latest['follow_up_flag']]['mobile_number'].nunique()
-        assigned_to_agent = bot_latest[bot_latest['assigned_to_agent_flag']]['mobile_number'].nunique()
-        lost = bot_latest[bot_latest['lost_flag']]['mobile_number'].nunique()
-        converted = bot_latest[bot_latest['converted_flag']]['mobile_number'].nunique()
-
-        unique_leads_row[bot_name] = unique_leads
-        total_attempts_row[bot_name] = total_attempts
-        avg_attempts_row[bot_name] = avg_attempts
-        connected_row[bot_name] = connected_count
-        connectivity_perc_row[bot_name] = connectivity_perc
-        not_connected_row[bot_name] = not_connected_count
-        follow_up_row[bot_name] = follow_up_count
-        assigned_agent_row[bot_name] = assigned_to_agent
-        lost_row[bot_name] = lost
-        converted_row[bot_name] = converted
-
-    report_data = [
-        unique_leads_row,
-        total_attempts_row,
-        avg_attempts_row,
-        connected_row,
-        connectivity_perc_row,
-        not_connected_row,
-        follow_up_row,
-        assigned_agent_row,
-        lost_row,
-        converted_row
-    ]
+    # One aggregation per frame yields every per-bot metric column
+    call_aggs = {'total_attempts': ('date', 'size')}
     if avg_col is not None and avg_col in df.columns:
-        avg_row = {'Metric': f"Avg {avg_col}"}
-        for bot_name in all_bots:
-            bot_df = df[df['bot'] == bot_name]
-            avg_val = round(bot_df[avg_col].mean(), 2) if not bot_df.empty else 0.0
-            avg_row[bot_name] = avg_val
-        report_data.append(avg_row)
-
-    report_df = pd.DataFrame(report_data)
-    report_df = report_df.set_index('Metric')
+        call_aggs['avg_value'] = (avg_col, 'mean')
+    call_stats = df.groupby('bot', observed=True).agg(**call_aggs).reindex(all_bots)
+
+    # latest_per_lead holds one row per (bot, mobile_number), so per-bot row counts are the unique lead counts
+    # and each outcome count is a bincount of bot codes weighted by the flag column
+    lead_bot_codes = latest_per_lead['bot'].cat.codes.to_numpy().astype(np.intp)
+    lead_stats = pd.DataFrame({
+        name: np.bincount(
+            lead_bot_codes,
+            weights=None if flag is None else latest_per_lead[flag].to_numpy(),
+            minlength=len(all_bots),
+        )
+        for name, flag in [
+            ('unique_leads', None),
+            ('connected', 'connected_flag'),
+            ('not_connected', 'not_connected_flag'),
+            ('follow_up', 'follow_up_flag'),
+            ('assigned_to_agent', 'assigned_to_agent_flag'),
+            ('lost', 'lost_flag'),
+            ('converted', 'converted_flag'),
+        ]
+    }, index=all_bots).astype('int64')
+
+    unique_leads = lead_stats['unique_leads']
+    has_leads = unique_leads > 0
+    avg_attempts = (call_stats['total_attempts'] / unique_leads).round(2).where(has_leads, 0.0)
+    connectivity_perc = (lead_stats['connected'] / unique_leads).round(2).where(has_leads, 0.0)
+
+    report_rows = {
+        'Unique leads': unique_leads,
+        'Total Attempts': call_stats['total_attempts'],
+        'Avg Attempts': avg_attempts,
+        'Connected': lead_stats['connected'],
+        'Connectivity % :': connectivity_perc,
+        'Not Connected': lead_stats['not_connected'],
+        'Follow Up': lead_stats['follow_up'],
+        'Assigned to human agent': lead_stats['assigned_to_agent'],
+        'Lost': lead_stats['lost'],
+        'Converted': lead_stats['converted'],
+    }
+    if 'avg_value' in call_stats.columns:
+        report_rows[f"Avg {avg_col}"] = call_stats['avg_value'].round(2)
+
+    report_df = pd.concat(report_rows, axis=1).astype('float64').T
+    report_df = report_df.rename_axis(index='Metric', columns=None)
 
     return report_df, sheets_by_category
 
 
 def style_summary_df(df):
-    def style_data_rows(s):
-        style = 'background-color: #C0C0C0; color: #000000; border: 1px solid #000000;'
-        if s.name == 'Converted':
-            style = 'background-color: #fff700; color: #000000; border: 1px solid #000000;'
-        if s.name.startswith("Avg "):  # Style average row lightly
-            style = 'background-color: #e6f2ff; color: #004080; border: 1px solid #004080; font-style: italic;'
-        return [style] * len(s)
-
-    def style_index_cells(label):
-        style = 'background-color: #C0C0C0; color: #000000; font-weight: bold; border: 1px solid #000000;'
-        if label == 'Converted':
-            style = 'background-color: #fff700; color: #000000; font-weight: bold; border: 1px solid #000000;'
-        if label.startswith("Avg "):
-            style = 'background-color: #e6f2ff; color: #004080; font-weight: bold; border: 1px solid #004080; font-style: italic;'
-        return style
+    # Styles depend only on the row label, so each is computed once per row for the whole frame
+    def row_styles(labels, font_weight=''):
+        labels = pd.Index(labels).astype(str)
+        styles = np.full(len(labels), f'background-color: #C0C0C0; color: #000000; {font_weight}border: 1px solid #000000;', dtype=object)
+        styles[labels == 'Converted'] = f'background-color: #fff700; color: #000000; {font_weight}border: 1px solid #000000;'
+        # Style average rows lightly
+        styles[labels.str.startswith("Avg ")] = f'background-color: #e6f2ff; color: #004080; {font_weight}border: 1px solid #004080; font-style: italic;'
+        return styles
+
+    def style_data_rows(data):
+        styles = row_styles(data.index)
+        return pd.DataFrame(np.repeat(styles[:, None], data.shape[1], axis=1), index=data.index, columns=data.columns)
+
+    def style_index_cells(labels):
+        return row_styles(labels, font_weight='font-weight: bold; ')
 
     styler = df.style
-    styler = styler.apply(style_data_rows, axis=1, subset=pd.IndexSlice[:, df.columns])
-    styler = styler.map_index(style_index_cells, axis=0)
+    styler = styler.apply(style_data_rows, axis=None, subset=pd.IndexSlice[:, df.columns])
+    styler = styler.apply_index(style_index_cells, axis=0)
     styler = styler.set_table_styles([
         {'selector': 'th.col_heading', 'props': [
             ('background-color', '#fff700'),
@@ -156,20 +210,95 @@ def style_summary_df(df):
     return styler
 
 
-def style_generic_df(df):
-    styler = df.style
-    styler = styler.set_table_styles([
-        {'selector': 'th', 'props': [
-            ('background-color', '#fff700'),
-            ('color', '#000000'),
-            ('font-weight', 'bold')
-        ]}
-    ], overwrite=True)
+def sheet_frame(sheet):
+    if isinstance(sheet, tuple):
+        frame, mask = sheet
+        return frame[mask]
+    return sheet
 
-    numeric_cols = df.select_dtypes(include='number').columns.tolist()
-    if numeric_cols:
-        styler = styler.format('{:.2f}', subset=numeric_cols)
-    return styler
+
+@st.cache_data(show_spinner=True, max_entries=4)
+def read_call_log(file_bytes, filename):
+    if filename.endswith('.csv'):
+        # Type text columns as strings while parsing: mobile_number keeps leading zeros and '+' prefixes,
+        # and an all-blank column comes back as null strings rather than Arrow's untyped null
+        text_cols = ['bot', 'mobile_number', 'outcome', 'recording_url']
+        convert_options = pa_csv.ConvertOptions(
+            column_types={col: pa.string() for col in text_cols}, strings_can_be_null=True
+        )
+        table = pa_csv.read_csv(BytesIO(file_bytes), convert_options=convert_options)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    return pd.read_excel(BytesIO(file_bytes), dtype={'mobile_number': str})
+
+
+# Streamlit keys cached functions on their own source only, so persisted reports are also keyed on this
+# file's hash; any change to the parsing or report code then misses the old entries.
+with open(__file__, 'rb') as app_source:
+    PIPELINE_VERSION = hashlib.sha256(app_source.read()).hexdigest()
+
+
+# Persisted so re-uploading the same file skips the report even after a restart.
+# No ttl: Streamlit ignores it for disk-persisted caches. Clear stale entries with `streamlit cache clear`.
+@st.cache_data(persist="disk", max_entries=32, show_spinner="Computing report…")
+def load_and_report(file_bytes, filename, avg_col, pipeline_version):
+    raw_df = read_call_log(file_bytes, filename)
+    return calculate_report(raw_df, avg_col)
+
+
+EXCEL_CACHE_ENTRIES = 4
+
+
+@st.cache_resource
+def excel_export_dir():
+    return tempfile.mkdtemp(prefix='cp_report_')
+
+
+def write_excel(path, report_df, sheets_by_category):
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        style_summary_df(report_df).to_excel(writer, sheet_name="Summary", index=True)
+
+        # Category sheets are written as plain frames; only their header row is styled
+        header_fmt = writer.book.add_format({'bold': True, 'bg_color': '#fff700', 'font_color': '#000000'})
+        for category_name, sheet in sheets_by_category.items():
+            df_cat = sheet_frame(sheet)
+            df_cat.to_excel(writer, sheet_name=category_name, index=False)
+            worksheet = writer.sheets[category_name]
+            for col_num, col_name in enumerate(df_cat.columns):
+                worksheet.write(0, col_num, col_name, header_fmt)
+
+
+# Keyed on report_key only; the workbook is written once per key into a dedicated temp dir and reused across reruns
+@st.cache_resource(show_spinner=True, max_entries=EXCEL_CACHE_ENTRIES, validate=lambda path: os.path.exists(path))
+def build_excel_file(report_key, _report_df, _sheets_by_category):
+    export_dir = excel_export_dir()
+    path = os.path.join(export_dir, f"{hashlib.sha256(report_key.encode()).hexdigest()}.xlsx")
+    try:
+        write_excel(path, _report_df, _sheets_by_category)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    # Keep only as many workbooks as the cache can hold; an entry whose file was pruned is rebuilt via validate.
+    # Other sessions prune the same dir, so files may vanish between listing and removal.
+    workbooks = []
+    for name in os.listdir(export_dir):
+        with contextlib.suppress(FileNotFoundError):
+            workbooks.append((os.path.getmtime(os.path.join(export_dir, name)), os.path.join(export_dir, name)))
+    workbooks.sort(reverse=True)
+    for _, stale_path in workbooks[EXCEL_CACHE_ENTRIES:]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(stale_path)
+    return path
+
+
+def open_excel_file(report_key, report_df, sheets_by_category):
+    # Pruning keeps the newest files while the cache evicts least-recently-used entries, so another session can
+    # remove a path right after it was validated; the retry misses validate and rebuilds the workbook
+    try:
+        return open(build_excel_file(report_key, report_df, sheets_by_category), 'rb')
+    except FileNotFoundError:
+        return open(build_excel_file(report_key, report_df, sheets_by_category), 'rb')
 
 
 st.title("Call Performance Report Generator")
@@ -177,10 +306,8 @@ st.title("Call Performance Report Generator")
 uploaded_file = st.file_uploader("Upload Call Log File", type=["csv", "xlsx"])
 
 if uploaded_file is not None:
-    if uploaded_file.name.endswith('.csv'):
-        raw_df = pd.read_csv(uploaded_file, dtype={'mobile_number': str})
-    else:
-        raw_df = pd.read_excel(uploaded_file, dtype={'mobile_number': str})
+    file_bytes = uploaded_file.getvalue()
+    raw_df = read_call_log(file_bytes, uploaded_file.name)
 
     st.markdown("### Raw Data Preview")
     st.dataframe(raw_df.head(), use_container_width=True)
@@ -192,27 +319,22 @@ if uploaded_file is not None:
     if avg_enabled and numeric_cols:
         avg_col = st.selectbox("Select numeric column for average", numeric_cols, key="avg_col_select")
 
-    report_df, sheets_by_category = calculate_report(raw_df, avg_col if avg_enabled else None)
+    report_df, sheets_by_category = load_and_report(
+        file_bytes, uploaded_file.name, avg_col if avg_enabled else None, PIPELINE_VERSION
+    )
 
     if report_df is not None:
         st.markdown("### Summary Report")
         styled_summary = style_summary_df(report_df)
         st.dataframe(styled_summary, use_container_width=True)
 
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            styled_summary.to_excel(writer, sheet_name="Summary", index=True)
-            for category_name, df_cat in sheets_by_category.items():
-                styled_cat = style_generic_df(df_cat)
-                styled_cat.to_excel(writer, sheet_name=category_name, index=False)
-
-        output.seek(0)
-
-        st.download_button(
-            label="📥 Download Styled Excel Report",
-            data=output,
-            file_name="Styled_Call_Report.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        report_key = f"{hashlib.sha256(file_bytes).hexdigest()}:{avg_col if avg_enabled else ''}"
+        with open_excel_file(report_key, report_df, sheets_by_category) as excel_file:
+            st.download_button(
+                label="📥 Download Styled Excel Report",
+                data=excel_file,
+                file_name="Styled_Call_Report.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
 else:
     st.info("Please upload a CSV or XLSX file to start the report generation.")
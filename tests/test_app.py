@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app
+
+
+def test_read_call_log_keeps_mobile_numbers_as_strings():
+    csv_bytes = (
+        b"bot,mobile_number,outcome,contacted,date,recording_url\n"
+        b"a,0912345,converted,1,2024-01-01 10:00:00,http://r/1\n"
+        b"a,+9199,lost,1,2024-01-02 10:00:00,\n"
+        b"b,,callback,0,2024-01-03 10:00:00,\n"
+    )
+    df = app.read_call_log(csv_bytes, "calls.csv")
+
+    assert df['mobile_number'].tolist()[:2] == ['0912345', '+9199']
+    assert df['mobile_number'].isna().tolist() == [False, False, True]
+
+    report_df, _ = app.calculate_report(df, None)
+    assert report_df.loc['Unique leads', 'a'] == 2
+    assert report_df.loc['Unique leads', 'b'] == 0
+
+
+def test_calculate_report_handles_all_blank_outcome_and_recording_columns():
+    csv_bytes = (
+        b"bot,mobile_number,outcome,contacted,date,recording_url\n"
+        b"b,1,,1,2024-01-01 10:00:00,\n"
+        b"b,2,,1,2024-01-01 11:00:00,\n"
+    )
+    df = app.read_call_log(csv_bytes, "calls.csv")
+
+    report_df, _ = app.calculate_report(df, None)
+    assert report_df.loc['Unique leads', 'b'] == 2
+    assert report_df.loc['Connected', 'b'] == 0
+    assert report_df.loc['Not Connected', 'b'] == 2
+    assert report_df.loc['Follow Up', 'b'] == 2
+
+
+def test_calculate_report_breaks_same_date_ties_toward_the_last_call():
+    csv_bytes = (
+        b"bot,mobile_number,outcome,contacted,date,recording_url\n"
+        b"a,1,callback,1,2024-01-01,\n"
+        b"a,1,converted,1,2024-01-01,\n"
+    )
+    df = app.read_call_log(csv_bytes, "calls.csv")
+
+    report_df, sheets_by_category = app.calculate_report(df, None)
+    assert report_df.loc['Converted', 'a'] == 1
+    assert report_df.loc['Follow Up', 'a'] == 0
+    assert app.sheet_frame(sheets_by_category['converted'])['outcome'].tolist() == ['converted']